@@ -25,19 +25,26 @@ MCP 工具：
 """
 
 import asyncio
-import json
+import collections
+import hashlib
 import logging
 import os
 import re
 import sys
+import time
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import aiofiles
-import aiohttp
+import html2text
+import httpx
+import lxml.etree
+import lxml.html
 import markdown
+import orjson
 import pandoc
 from bs4 import BeautifulSoup
 from mcp.server import Server
@@ -64,84 +71,286 @@ CONFIG = {
     "max_file_size": 50 * 1024 * 1024,  # 50MB
     "batch_size": 10,
     "timeout": 300,  # 5分钟
+    "concurrency": 5,  # 批量迁移的默认并发数
 }
 
-# 迁移状态跟踪
-migration_status = {}
+# 迁移状态跟踪 - 只保留最近的任务（LRU 淘汰），避免服务器长期运行时无限增长；
+# 所有读写都要持有 _status_lock，防止批量任务并发更新时读到不一致的快照
+migration_status: "collections.OrderedDict[str, Dict[str, Any]]" = collections.OrderedDict()
+_STATUS_MAX = 256
+_status_lock = asyncio.Lock()
+
+async def update_status(task_id: str, **fields):
+    """更新任务状态（加锁，并按 LRU 淘汰最旧的任务记录）"""
+    async with _status_lock:
+        migration_status.setdefault(task_id, {}).update(fields)
+        migration_status.move_to_end(task_id)
+        while len(migration_status) > _STATUS_MAX:
+            migration_status.popitem(last=False)
+
+# 格式自动检测 - 预编译，只扫描前 4KB 找第一个非空白字符，
+# 避免 content.strip() 对大文档（上限 50MB）做整体复制
+_FIRST_NONSPACE_RE = re.compile(r'\S')
+
+# 词数统计 - finditer 单遍计数，不像 str.split() 那样为大文档物化整个词列表
+_WORD_RE = re.compile(r'\S+')
+
+# Markdown 一级标题嗅探 - 只取标题时无需整篇解析，扫描开头 4KB 即可
+_TITLE_RE = re.compile(r'^\s*#\s+(.+?)\s*$', re.MULTILINE)
+
+def _dumps(obj: Any, pretty: bool = False) -> str:
+    """序列化工具响应为 JSON 字符串
+
+    使用 orjson（C 实现）代替标准库 json.dumps - 解析结果包含完整的
+    html_content/raw_content 时响应可达数 MB，序列化速度差距显著。
+    orjson 本身输出 UTF-8，无需 ensure_ascii=False。默认不缩进：调用方
+    多为程序化消费，缩进只会平白放大多 MB 的响应。
+    """
+    option = orjson.OPT_NON_STR_KEYS
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, option=option).decode('utf-8')
+
+def _text(obj: Any, pretty: bool = False) -> TextContent:
+    """把结果对象包装成 MCP 文本响应（orjson 的 UTF-8 输出只在此解码一次）"""
+    return TextContent(type="text", text=_dumps(obj, pretty))
+
+# 全局 HTTP 客户端 - 所有迁移请求复用同一个连接池，避免每次请求重建 TCP/TLS
+# 连接；启用 HTTP/2 后同一条 TLS 连接即可多路复用大量并发请求（Notion 的
+# 块追加批次尤其受益），显著减少套接字与握手数量
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    """获取全局共享的 httpx 客户端（惰性创建）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=64,
+                max_connections=256,
+            ),
+            timeout=CONFIG["timeout"],
+        )
+    return _client
+
+def _parse_retry_after(value: Optional[str]) -> float:
+    """解析 Retry-After 头的值（秒）
+
+    RFC 允许秒数和 HTTP 日期两种写法；无法解析时回退为 1 秒，
+    限流响应不能因为头格式问题变成不可重试的失败。
+    """
+    if not value:
+        return 1.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+        return max(0.0, (dt - datetime.now(dt.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return 1.0
+
+class RateLimiter:
+    """按主机限流器 - 限制单主机并发并在远端限流时指数退避
+
+    Confluence 和 Notion 都按 token 限流，批量迁移并发化之后很容易触发
+    429。这里为每个主机维护一个信号量和"下次可发送时间"：收到 429 时按
+    Retry-After 退避并重试，期间同主机的其它请求也一并等待，在不触发限流
+    的前提下维持最高吞吐。
+    """
+
+    def __init__(self, per_host_limit: int = 10, max_retries: int = 5):
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_allowed_at: Dict[str, float] = {}
+
+    async def request(self, client: httpx.AsyncClient, method: str,
+                      url: str, **kwargs) -> httpx.Response:
+        """发送请求，429 时按 Retry-After 指数退避重试"""
+        host = urlparse(url).netloc
+        sem = self._semaphores.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+
+        async with sem:
+            for attempt in range(self.max_retries):
+                # 该主机仍在退避窗口内则先等待
+                delay = self._next_allowed_at.get(host, 0.0) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                response = await client.request(method, url, **kwargs)
+                if response.status_code != 429:
+                    return response
+
+                retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                backoff = retry_after * (2 ** attempt)
+                self._next_allowed_at[host] = time.monotonic() + backoff
+                await asyncio.sleep(backoff)
+
+            raise Exception(f"{host} 持续限流，重试 {self.max_retries} 次后放弃")
+
+# 全局限流器 - 所有平台 API 调用共用，保证按主机统一退避
+_rate_limiter = RateLimiter()
+
+# Markdown 转换器只构建一次（扩展加载开销大），每次使用前 reset() 即可复用
+_MD = markdown.Markdown(extensions=[
+    'meta', 'toc', 'tables', 'fenced_code', 'codehilite'
+])
+
+# 解析结果缓存 - 同一文档在迁移流程中会被重复解析（如 Notion 迁移再次解析内容），
+# 按内容摘要做 LRU 缓存让重复解析变为 O(1)
+_PARSE_CACHE: "collections.OrderedDict[Tuple[bytes, frozenset], Dict[str, Any]]" = collections.OrderedDict()
+_PARSE_CACHE_MAX = 1024
+
+# parse_markdown 默认返回的字段 - html_content/raw_content 是输入的完整副本，
+# 只有调用方显式要求时才放进结果，避免响应体积和峰值内存翻倍
+_DEFAULT_INCLUDE = frozenset({'structure', 'metadata'})
+
+_HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+# 代码块语言提取 - 预编译，避免对每个节点做 replace 字符串重建
+_LANG_RE = re.compile(r'language-(\S+)')
+
+async def _read_document(path: str) -> str:
+    """异步读取文档文件
+
+    先用 os.stat 校验大小上限，避免把超限文件整个读进内存；随后以 1MB
+    分块异步读取，读盘不会阻塞事件循环，可与其它文档的迁移并发进行。
+    """
+    size = os.stat(path).st_size
+    if size > CONFIG["max_file_size"]:
+        raise ValueError(
+            f"文件过大: {path} ({size} 字节，上限 {CONFIG['max_file_size']} 字节)"
+        )
+
+    buf = bytearray()
+    async with aiofiles.open(path, 'rb') as f:
+        while True:
+            chunk = await f.read(1 << 20)
+            if not chunk:
+                break
+            buf += chunk
+    return bytes(buf).decode('utf-8', 'replace')
+
+def _extract_structure(html_content: str) -> Dict[str, List[Dict[str, Any]]]:
+    """单次遍历提取文档结构（标题、代码块、图片、链接）
+
+    直接在 lxml 树上遍历：el.get 属性访问是 C 实现，省掉 BeautifulSoup
+    每个节点的 Python 层包装和字典查找开销；整棵树仍然只走一遍。
+    """
+    headings = []
+    code_blocks = []
+    images = []
+    links = []
+    structure = {
+        'headings': headings,
+        'code_blocks': code_blocks,
+        'images': images,
+        'links': links,
+    }
+
+    if not html_content or html_content.isspace():
+        return structure
+
+    try:
+        tree = lxml.html.fromstring(html_content)
+    except lxml.etree.ParserError:
+        # 只含注释/doctype 的输出没有元素节点，fromstring 会报 Document is empty
+        return structure
+    for el in tree.iter():
+        name = el.tag
+        if not isinstance(name, str):
+            # 注释、处理指令等非元素节点
+            continue
+
+        if name in _HEADING_TAGS:
+            headings.append({
+                'level': int(name[1]),
+                'text': el.text_content().strip(),
+                'id': el.get('id', ''),
+            })
+        elif name == 'code':
+            parent = el.getparent()
+            if parent is not None and parent.tag == 'pre':
+                m = _LANG_RE.search(el.get('class', ''))
+                code_blocks.append({
+                    'language': m.group(1) if m else '',
+                    'content': el.text_content(),
+                })
+        elif name == 'img':
+            images.append({
+                'src': el.get('src', ''),
+                'alt': el.get('alt', ''),
+                'title': el.get('title', ''),
+            })
+        elif name == 'a':
+            href = el.get('href', '')
+            if href and not href.startswith('#'):
+                links.append({
+                    'url': href,
+                    'text': el.text_content().strip(),
+                    'title': el.get('title', ''),
+                })
+
+    return structure
 
 class DocumentParser:
     """文档解析器 - 支持多种格式的文档解析"""
-    
+
     @staticmethod
-    async def parse_markdown(content: str) -> Dict[str, Any]:
-        """解析 Markdown 文档"""
+    async def parse_markdown(content: str,
+                             include: Optional[set] = None) -> Dict[str, Any]:
+        """解析 Markdown 文档
+
+        include 控制结果中包含哪些可选字段（structure/metadata/html_content/
+        raw_content）；format/title/word_count 等轻量字段总是返回。
+        """
         try:
-            # 使用 markdown 库解析
-            md = markdown.Markdown(extensions=[
-                'meta', 'toc', 'tables', 'fenced_code', 'codehilite'
-            ])
-            html_content = md.convert(content)
-            
+            include = frozenset(include) if include is not None else _DEFAULT_INCLUDE
+
+            # 命中缓存直接返回
+            cache_key = (
+                hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest(),
+                include,
+            )
+            cached = _PARSE_CACHE.get(cache_key)
+            if cached is not None:
+                _PARSE_CACHE.move_to_end(cache_key)
+                return cached
+
+            # 使用 markdown 库解析（复用模块级转换器）
+            _MD.reset()
+            html_content = _MD.convert(content)
+
             # 提取元数据
-            metadata = getattr(md, 'Meta', {})
-            
-            # 解析文档结构
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # 提取标题结构
-            headings = []
-            for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                headings.append({
-                    'level': int(heading.name[1]),
-                    'text': heading.get_text().strip(),
-                    'id': heading.get('id', ''),
-                })
-            
-            # 提取代码块
-            code_blocks = []
-            for code in soup.find_all('code'):
-                if code.parent.name == 'pre':
-                    code_blocks.append({
-                        'language': code.get('class', [''])[0].replace('language-', ''),
-                        'content': code.get_text(),
-                    })
-            
-            # 提取图片
-            images = []
-            for img in soup.find_all('img'):
-                images.append({
-                    'src': img.get('src', ''),
-                    'alt': img.get('alt', ''),
-                    'title': img.get('title', ''),
-                })
-            
-            # 提取链接
-            links = []
-            for link in soup.find_all('a'):
-                href = link.get('href', '')
-                if href and not href.startswith('#'):
-                    links.append({
-                        'url': href,
-                        'text': link.get_text().strip(),
-                        'title': link.get('title', ''),
-                    })
-            
-            return {
+            metadata = getattr(_MD, 'Meta', {})
+
+            result = {
                 'format': 'markdown',
                 'title': metadata.get('title', [''])[0] if metadata.get('title') else '',
-                'metadata': metadata,
-                'html_content': html_content,
-                'raw_content': content,
-                'structure': {
-                    'headings': headings,
-                    'code_blocks': code_blocks,
-                    'images': images,
-                    'links': links,
-                },
-                'word_count': len(content.split()),
-                'estimated_read_time': max(1, len(content.split()) // 200),
             }
-            
+            if 'metadata' in include:
+                result['metadata'] = metadata
+            if 'html_content' in include:
+                result['html_content'] = html_content
+            if 'raw_content' in include:
+                result['raw_content'] = content
+            if 'structure' in include:
+                # 提取标题结构、代码块、图片、链接（lxml 建树 + 单次遍历）
+                result['structure'] = _extract_structure(html_content)
+            word_count = sum(1 for _ in _WORD_RE.finditer(content))
+            result['word_count'] = word_count
+            result['estimated_read_time'] = max(1, word_count // 200)
+
+            # 写入缓存并按 LRU 淘汰
+            _PARSE_CACHE[cache_key] = result
+            while len(_PARSE_CACHE) > _PARSE_CACHE_MAX:
+                _PARSE_CACHE.popitem(last=False)
+
+            return result
+
         except Exception as e:
             logger.error(f"解析 Markdown 失败: {e}")
             raise
@@ -150,7 +359,7 @@ class DocumentParser:
     async def parse_html(content: str) -> Dict[str, Any]:
         """解析 HTML 文档"""
         try:
-            soup = BeautifulSoup(content, 'html.parser')
+            soup = BeautifulSoup(content, 'lxml')
             
             # 提取标题
             title_tag = soup.find('title')
@@ -159,9 +368,8 @@ class DocumentParser:
             # 提取主要内容
             main_content = soup.find('main') or soup.find('article') or soup.find('body') or soup
             
-            # 转换为 Markdown
-            # 这里可以使用 html2text 或类似工具
-            import html2text
+            # 转换为 Markdown - HTML2Text 实例不能跨文档复用：handle() 会把
+            # 列表/引用块等解析状态留在实例上且没有重置接口，构建本身很廉价
             h = html2text.HTML2Text()
             h.ignore_links = False
             h.ignore_images = False
@@ -173,21 +381,66 @@ class DocumentParser:
                 'html_content': content,
                 'markdown_content': markdown_content,
                 'raw_content': content,
-                'word_count': len(main_content.get_text().split()),
+                'word_count': sum(1 for _ in _WORD_RE.finditer(main_content.get_text())),
             }
             
         except Exception as e:
             logger.error(f"解析 HTML 失败: {e}")
             raise
 
+# Pandoc 支持的格式列表 - 进程启动后探测一次并缓存，之后坏格式在 Python 层
+# 直接拒绝，不必为一个注定失败的转换再起 pandoc 进程
+_PANDOC_IN: Optional[frozenset] = None
+_PANDOC_OUT: Optional[frozenset] = None
+_pandoc_probed = False
+_pandoc_probe_lock = asyncio.Lock()
+
+async def _pandoc_formats() -> "Tuple[Optional[frozenset], Optional[frozenset]]":
+    """惰性探测 pandoc 支持的输入/输出格式（各调用一次 --list-*-formats）
+
+    探测失败（如 pandoc 不在 PATH 上）时返回 (None, None)，调用方跳过
+    校验，让 pandoc 自己在转换时报错。
+    """
+    global _PANDOC_IN, _PANDOC_OUT, _pandoc_probed
+    if _pandoc_probed:
+        return _PANDOC_IN, _PANDOC_OUT
+
+    async with _pandoc_probe_lock:
+        if _pandoc_probed:
+            return _PANDOC_IN, _PANDOC_OUT
+        try:
+            formats = []
+            for flag in ('--list-input-formats', '--list-output-formats'):
+                process = await asyncio.create_subprocess_exec(
+                    'pandoc', flag,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                stdout, _ = await process.communicate()
+                formats.append(frozenset(stdout.decode().split()))
+            _PANDOC_IN, _PANDOC_OUT = formats
+        except Exception as e:
+            logger.warning(f"探测 pandoc 格式列表失败，跳过格式预校验: {e}")
+            _PANDOC_IN = _PANDOC_OUT = None
+        _pandoc_probed = True
+
+    return _PANDOC_IN, _PANDOC_OUT
+
 class FormatConverter:
     """格式转换器 - 使用 Pandoc 进行格式转换"""
-    
+
     @staticmethod
     async def convert_with_pandoc(content: str, from_format: str, to_format: str, 
                                  options: Optional[Dict] = None) -> str:
         """使用 Pandoc 转换格式"""
         try:
+            # 用缓存的格式列表预校验，坏格式直接拒绝，省掉一次注定失败的进程启动
+            in_formats, out_formats = await _pandoc_formats()
+            if in_formats and from_format not in in_formats:
+                raise ValueError(f"pandoc 不支持的输入格式: {from_format}")
+            if out_formats and to_format not in out_formats:
+                raise ValueError(f"pandoc 不支持的输出格式: {to_format}")
+
             # 构建 Pandoc 命令
             cmd = ['pandoc', f'--from={from_format}', f'--to={to_format}']
             
@@ -205,27 +458,81 @@ class FormatConverter:
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
-            
-            stdout, stderr = await process.communicate(content.encode('utf-8'))
-            
+
+            # 流式写入/读取，避免 communicate() 对大文档（上限 50MB）整体缓冲两次
+            chunk_size = 1 << 20  # 1MB
+
+            async def _feed_stdin():
+                # pandoc 提前退出（如选项非法）时写入端会收到管道断开异常，
+                # 吞掉它让流程走到 returncode 检查，报出 pandoc 的真实错误
+                try:
+                    data = memoryview(content.encode('utf-8'))
+                    for offset in range(0, len(data), chunk_size):
+                        process.stdin.write(data[offset:offset + chunk_size])
+                        await process.stdin.drain()
+                    process.stdin.write_eof()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            async def _read_stdout() -> bytearray:
+                buf = bytearray()
+                while True:
+                    chunk = await process.stdout.read(chunk_size)
+                    if not chunk:
+                        break
+                    buf += chunk
+                return buf
+
+            # stderr 必须并发消费，否则大量错误输出会填满管道缓冲造成死锁
+            _, stdout_buf, stderr_buf = await asyncio.gather(
+                _feed_stdin(), _read_stdout(), process.stderr.read()
+            )
+            await process.wait()
+
             if process.returncode != 0:
-                raise Exception(f"Pandoc 转换失败: {stderr.decode()}")
-            
-            return stdout.decode('utf-8')
+                raise Exception(f"Pandoc 转换失败: {stderr_buf.decode('utf-8', 'replace')}")
+
+            return bytes(stdout_buf).decode('utf-8', 'replace')
             
         except Exception as e:
             logger.error(f"Pandoc 转换失败: {e}")
             raise
     
+    # Confluence 转换选项（单篇和批量转换共用）
+    CONFLUENCE_OPTIONS = {
+        'wrap': 'none',
+        'atx-headers': True,
+    }
+
+    @staticmethod
+    async def convert_batch_with_pandoc(contents: List[str], from_format: str,
+                                        to_format: str,
+                                        options: Optional[Dict] = None) -> List[str]:
+        """批量转换格式 - 多个文档逐篇并发调用 Pandoc
+
+        文档必须各自独立转换：拼接成一次调用会让 Markdown 状态跨文档泄漏
+        （某篇定义的引用式链接/脚注会在别的文档里解析），未闭合的代码围栏
+        还会把分隔符连同后续文档整个吞进代码块。这里用信号量限并发逐篇
+        转换，进程启动开销靠并发重叠来掩盖。
+        """
+        if not contents:
+            return []
+
+        sem = asyncio.Semaphore(CONFIG["concurrency"])
+
+        async def _one(content: str) -> str:
+            async with sem:
+                return await FormatConverter.convert_with_pandoc(
+                    content, from_format, to_format, options
+                )
+
+        return list(await asyncio.gather(*[_one(c) for c in contents]))
+
     @staticmethod
     async def markdown_to_confluence(content: str) -> str:
         """Markdown 转换为 Confluence 格式"""
-        options = {
-            'wrap': 'none',
-            'atx-headers': True,
-        }
         return await FormatConverter.convert_with_pandoc(
-            content, 'markdown', 'confluence', options
+            content, 'markdown', 'confluence', FormatConverter.CONFLUENCE_OPTIONS
         )
     
     @staticmethod
@@ -241,13 +548,44 @@ class FormatConverter:
 
 class PlatformMigrator:
     """平台迁移器 - 处理到各种平台的迁移"""
-    
+
+    # Notion 单次请求最多接受 100 个块
+    NOTION_BLOCK_LIMIT = 100
+
+    @staticmethod
+    async def _append_notion_blocks(client: httpx.AsyncClient, page_id: str,
+                                    headers: Dict[str, str], blocks: List[Dict]):
+        """把超出首次请求限制的块按批追加到 Notion 页面
+
+        按 100 个块一批顺序 PATCH 到 blocks/{page_id}/children - Notion 按
+        请求到达顺序追加，批次必须串行才能保证块的先后次序（并发写同一
+        页面还会触发 409）；文档之间的并发已由批量任务的 worker 池提供。
+        429 退避重试由全局限流器统一处理。
+        """
+        url = f"https://api.notion.com/v1/blocks/{page_id}/children"
+        limit = PlatformMigrator.NOTION_BLOCK_LIMIT
+
+        for i in range(0, len(blocks), limit):
+            response = await _rate_limiter.request(
+                client, 'PATCH', url, headers=headers,
+                json={'children': blocks[i:i + limit]}
+            )
+            if response.status_code != 200:
+                raise Exception(f"Notion API 错误: {response.status_code} - {response.text}")
+
     @staticmethod
-    async def migrate_to_confluence(content: str, config: Dict[str, Any]) -> Dict[str, Any]:
-        """迁移到 Confluence"""
+    async def migrate_to_confluence(content: str, config: Dict[str, Any],
+                                    client: Optional[httpx.AsyncClient] = None,
+                                    confluence_content: Optional[str] = None) -> Dict[str, Any]:
+        """迁移到 Confluence
+
+        批量迁移时可通过 confluence_content 传入预先转换好的内容，跳过逐篇调用 Pandoc。
+        """
         try:
-            # 转换格式
-            confluence_content = await FormatConverter.markdown_to_confluence(content)
+            client = client or get_client()
+            # 转换格式（批量路径已预转换时跳过）
+            if confluence_content is None:
+                confluence_content = await FormatConverter.markdown_to_confluence(content)
             
             # 构建 API 请求
             url = f"{config['base_url']}/rest/api/content"
@@ -271,20 +609,20 @@ class PlatformMigrator:
             if config.get('parent_id'):
                 payload['ancestors'] = [{'id': config['parent_id']}]
             
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return {
-                            'success': True,
-                            'page_id': result['id'],
-                            'page_url': f"{config['base_url']}{result['_links']['webui']}",
-                            'title': result['title'],
-                        }
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Confluence API 错误: {response.status} - {error_text}")
+            # 发送请求（复用全局连接池，经限流器退避重试）
+            response = await _rate_limiter.request(
+                client, 'POST', url, headers=headers, json=payload
+            )
+            if response.status_code == 200:
+                result = response.json()
+                return {
+                    'success': True,
+                    'page_id': result['id'],
+                    'page_url': f"{config['base_url']}{result['_links']['webui']}",
+                    'title': result['title'],
+                }
+            else:
+                raise Exception(f"Confluence API 错误: {response.status_code} - {response.text}")
                         
         except Exception as e:
             logger.error(f"Confluence 迁移失败: {e}")
@@ -294,25 +632,29 @@ class PlatformMigrator:
             }
     
     @staticmethod
-    async def migrate_to_notion(content: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    async def migrate_to_notion(content: str, config: Dict[str, Any],
+                                client: Optional[httpx.AsyncClient] = None) -> Dict[str, Any]:
         """迁移到 Notion"""
         try:
-            # 解析 Markdown 内容
-            parsed = await DocumentParser.parse_markdown(content)
-            
+            client = client or get_client()
+            # 提取标题 - 目前只用得到标题，在开头 4KB 嗅探一级标题即可，
+            # 不必为此完整解析整篇文档（块级转换实现后改用缓存的解析结果）
+            m = _TITLE_RE.search(content, 0, 4096)
+            title = m.group(1) if m else config.get('title', 'Migrated Document')
+
             # 构建 Notion 块结构
             blocks = []
-            
+
             # 添加标题
-            if parsed.get('title'):
+            if title:
                 blocks.append({
                     'object': 'block',
                     'type': 'heading_1',
                     'heading_1': {
-                        'rich_text': [{'type': 'text', 'text': {'content': parsed['title']}}]
+                        'rich_text': [{'type': 'text', 'text': {'content': title}}]
                     }
                 })
-            
+
             # 转换内容为 Notion 块
             # 这里需要更复杂的解析逻辑来处理各种 Markdown 元素
             
@@ -331,23 +673,32 @@ class PlatformMigrator:
                         'title': [{'text': {'content': config.get('title', 'Migrated Document')}}]
                     }
                 },
-                'children': blocks[:100]  # Notion 限制每次最多100个块
+                # Notion 限制每次最多 100 个块，其余的在页面创建后分批追加
+                'children': blocks[:PlatformMigrator.NOTION_BLOCK_LIMIT]
+            }
+
+            # 发送请求（复用全局连接池，经限流器退避重试）
+            response = await _rate_limiter.request(
+                client, 'POST', url, headers=headers, json=payload
+            )
+            if response.status_code == 200:
+                result = response.json()
+            else:
+                raise Exception(f"Notion API 错误: {response.status_code} - {response.text}")
+
+            # 超出首次请求限制的块并发追加，不再静默丢弃
+            if len(blocks) > PlatformMigrator.NOTION_BLOCK_LIMIT:
+                await PlatformMigrator._append_notion_blocks(
+                    client, result['id'], headers,
+                    blocks[PlatformMigrator.NOTION_BLOCK_LIMIT:],
+                )
+
+            return {
+                'success': True,
+                'page_id': result['id'],
+                'page_url': result['url'],
+                'title': config.get('title', 'Migrated Document'),
             }
-            
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return {
-                            'success': True,
-                            'page_id': result['id'],
-                            'page_url': result['url'],
-                            'title': config.get('title', 'Migrated Document'),
-                        }
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Notion API 错误: {response.status} - {error_text}")
                         
         except Exception as e:
             logger.error(f"Notion 迁移失败: {e}")
@@ -370,6 +721,19 @@ async def list_tools() -> List[Tool]:
                 "properties": {
                     "content": {"type": "string", "description": "文档内容"},
                     "format": {"type": "string", "enum": ["markdown", "html", "auto"], "default": "auto"},
+                    "include": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "enum": ["structure", "metadata", "html_content", "raw_content"],
+                        },
+                        "description": "结果中包含的可选字段，默认 structure 和 metadata",
+                    },
+                    "pretty": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "是否缩进输出 JSON（供人工阅读时开启）",
+                    },
                 },
                 "required": ["content"],
             },
@@ -441,15 +805,15 @@ async def list_tools() -> List[Tool]:
                         "items": {
                             "type": "object",
                             "properties": {
-                                "content": {"type": "string"},
+                                "content": {"type": "string", "description": "文档内容（与 path 二选一）"},
                                 "title": {"type": "string"},
-                                "path": {"type": "string"},
+                                "path": {"type": "string", "description": "文档文件路径，未提供 content 时从磁盘读取"},
                             },
-                            "required": ["content"],
                         },
                     },
                     "target_platform": {"type": "string", "enum": ["confluence", "notion"]},
                     "config": {"type": "object"},
+                    "concurrency": {"type": "integer", "minimum": 1, "description": "并发迁移的文档数", "default": 5},
                 },
                 "required": ["documents", "target_platform", "config"],
             },
@@ -474,22 +838,26 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
         if name == "parse_document":
             content = arguments["content"]
             format_type = arguments.get("format", "auto")
+            include = arguments.get("include")
             
-            # 自动检测格式
+            # 自动检测格式（前 4KB 足以区分 HTML 和 Markdown）
             if format_type == "auto":
-                if content.strip().startswith('<'):
+                m = _FIRST_NONSPACE_RE.search(content, 0, 4096)
+                if m and content[m.start()] == '<':
                     format_type = "html"
                 else:
                     format_type = "markdown"
             
             if format_type == "markdown":
-                result = await DocumentParser.parse_markdown(content)
+                result = await DocumentParser.parse_markdown(
+                    content, include=set(include) if include else None
+                )
             elif format_type == "html":
                 result = await DocumentParser.parse_html(content)
             else:
                 raise ValueError(f"不支持的格式: {format_type}")
             
-            return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+            return [_text(result, pretty=arguments.get("pretty", False))]
         
         elif name == "convert_format":
             content = arguments["content"]
@@ -509,7 +877,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             
             result = await PlatformMigrator.migrate_to_confluence(content, config)
             
-            return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+            return [_text(result)]
         
         elif name == "migrate_to_notion":
             content = arguments["content"]
@@ -517,7 +885,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             
             result = await PlatformMigrator.migrate_to_notion(content, config)
             
-            return [TextContent(type="text", text=json.dumps(result, indent=2, ensure_ascii=False))]
+            return [_text(result)]
         
         elif name == "batch_migrate":
             documents = arguments["documents"]
@@ -528,35 +896,38 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             task_id = f"migration_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
             # 初始化任务状态
-            migration_status[task_id] = {
-                'status': 'running',
-                'total': len(documents),
-                'completed': 0,
-                'failed': 0,
-                'results': [],
-                'start_time': datetime.now().isoformat(),
-            }
+            await update_status(
+                task_id,
+                status='running',
+                total=len(documents),
+                completed=0,
+                failed=0,
+                results=[],
+                start_time=datetime.now().isoformat(),
+            )
             
             # 异步执行批量迁移
-            asyncio.create_task(batch_migrate_task(task_id, documents, target_platform, config))
+            concurrency = arguments.get("concurrency", CONFIG["concurrency"])
+            asyncio.create_task(batch_migrate_task(
+                task_id, documents, target_platform, config, concurrency
+            ))
             
-            return [TextContent(type="text", text=json.dumps({
+            return [_text({
                 'task_id': task_id,
                 'status': 'started',
                 'total_documents': len(documents),
-            }, indent=2))]
+            })]
         
         elif name == "get_migration_status":
             task_id = arguments["task_id"]
             
-            if task_id not in migration_status:
-                return [TextContent(type="text", text=json.dumps({
-                    'error': f'任务 {task_id} 不存在'
-                }, indent=2))]
-            
-            status = migration_status[task_id].copy()
-            
-            return [TextContent(type="text", text=json.dumps(status, indent=2, ensure_ascii=False))]
+            # 在锁内取快照，避免与批量任务的并发写入交错
+            async with _status_lock:
+                if task_id not in migration_status:
+                    return [_text({'error': f'任务 {task_id} 不存在'})]
+                status = dict(migration_status[task_id])
+
+            return [_text(status)]
         
         else:
             return [TextContent(type="text", text=f"未知工具: {name}")]
@@ -565,63 +936,116 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
         logger.error(f"工具调用失败 {name}: {e}")
         return [TextContent(type="text", text=f"错误: {str(e)}")]
 
-async def batch_migrate_task(task_id: str, documents: List[Dict], 
-                           target_platform: str, config: Dict):
-    """批量迁移任务"""
-    try:
-        for i, doc in enumerate(documents):
-            try:
-                if target_platform == "confluence":
-                    result = await PlatformMigrator.migrate_to_confluence(
-                        doc["content"], {**config, "title": doc.get("title", f"Document {i+1}")}
-                    )
-                elif target_platform == "notion":
-                    result = await PlatformMigrator.migrate_to_notion(
-                        doc["content"], {**config, "title": doc.get("title", f"Document {i+1}")}
-                    )
-                else:
-                    result = {"success": False, "error": f"不支持的平台: {target_platform}"}
-                
-                migration_status[task_id]['results'].append({
+async def batch_migrate_task(task_id: str, documents: List[Dict],
+                           target_platform: str, config: Dict,
+                           concurrency: Optional[int] = None):
+    """批量迁移任务 - 生产者/消费者模式
+
+    生产者把文档送入有界队列，固定数量的 worker 消费。相比把全部文档一次
+    性交给 gather，有界队列天然提供背压（远端限流时生产者随队列满而暂停
+    入队），内存占用与文档总数无关；每篇完成时即时更新状态，进度可通过
+    get_migration_status 实时查询。
+    """
+    # 至少一个 worker - 非法的并发数（0/负数）会导致队列永远无人消费
+    workers = max(1, concurrency or CONFIG["concurrency"])
+
+    # Confluence 迁移需要 Pandoc 转换 - 整个批次合并为一次调用，摊薄进程启动开销
+    # （按 path 引用的文档在迁移时才从磁盘读取，不参与预转换）
+    converted: List[Optional[str]] = [None] * len(documents)
+    if target_platform == "confluence" and all('content' in doc for doc in documents):
+        try:
+            converted = await FormatConverter.convert_batch_with_pandoc(
+                [doc["content"] for doc in documents],
+                'markdown', 'confluence', FormatConverter.CONFLUENCE_OPTIONS,
+            )
+        except Exception as e:
+            logger.warning(f"批量 Pandoc 转换失败，回退为逐篇转换: {e}")
+            converted = [None] * len(documents)
+
+    async def _migrate_one(i: int, doc: Dict):
+        try:
+            content = doc.get("content")
+            if content is None and doc.get("path"):
+                # 从磁盘异步读取，与其它文档的迁移并发进行
+                content = await _read_document(doc["path"])
+
+            if content is None:
+                result = {"success": False, "error": "文档缺少 content 或 path"}
+            elif target_platform == "confluence":
+                result = await PlatformMigrator.migrate_to_confluence(
+                    content, {**config, "title": doc.get("title", f"Document {i+1}")},
+                    confluence_content=converted[i],
+                )
+            elif target_platform == "notion":
+                result = await PlatformMigrator.migrate_to_notion(
+                    content, {**config, "title": doc.get("title", f"Document {i+1}")}
+                )
+            else:
+                result = {"success": False, "error": f"不支持的平台: {target_platform}"}
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        # 状态计数在锁内更新，避免并发写入竞争
+        async with _status_lock:
+            status = migration_status.get(task_id)
+            if status is not None:
+                status['results'].append({
                     'document': doc.get('title', f'Document {i+1}'),
                     'result': result,
                 })
-                
                 if result.get('success'):
-                    migration_status[task_id]['completed'] += 1
+                    status['completed'] += 1
                 else:
-                    migration_status[task_id]['failed'] += 1
-                    
-            except Exception as e:
-                migration_status[task_id]['failed'] += 1
-                migration_status[task_id]['results'].append({
-                    'document': doc.get('title', f'Document {i+1}'),
-                    'result': {'success': False, 'error': str(e)},
-                })
-        
-        migration_status[task_id]['status'] = 'completed'
-        migration_status[task_id]['end_time'] = datetime.now().isoformat()
-        
+                    status['failed'] += 1
+
+    # 有界队列 - 容量为 worker 数的两倍即可喂饱所有 worker 又不堆积
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2 * workers)
+
+    async def _worker():
+        while True:
+            i, doc = await queue.get()
+            try:
+                await _migrate_one(i, doc)
+            finally:
+                queue.task_done()
+
+    worker_tasks = [asyncio.create_task(_worker()) for _ in range(workers)]
+    try:
+        for i, doc in enumerate(documents):
+            await queue.put((i, doc))
+        await queue.join()
+
+        await update_status(task_id, status='completed',
+                            end_time=datetime.now().isoformat())
+
     except Exception as e:
-        migration_status[task_id]['status'] = 'failed'
-        migration_status[task_id]['error'] = str(e)
-        migration_status[task_id]['end_time'] = datetime.now().isoformat()
+        await update_status(task_id, status='failed', error=str(e),
+                            end_time=datetime.now().isoformat())
+
+    finally:
+        for task in worker_tasks:
+            task.cancel()
 
 async def main():
     """启动 MCP 服务器"""
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="doc-migration-server",
-                server_version="1.0.0",
-                capabilities=app.get_capabilities(
-                    notification_options=None,
-                    experimental_capabilities=None,
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="doc-migration-server",
+                    server_version="1.0.0",
+                    capabilities=app.get_capabilities(
+                        notification_options=None,
+                        experimental_capabilities=None,
+                    ),
                 ),
-            ),
-        )
+            )
+    finally:
+        # 关闭全局 HTTP 客户端，释放连接池
+        if _client is not None and not _client.is_closed:
+            await _client.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())